@@ -5,8 +5,40 @@ defaultPagination = 5
 # ------------------------------------------------- # CalorieNinja request API + foods API parameters-------------------------------------------
 # calorieNinjas API key
 calNinjaKey = "PTmd4hCgvmMoONE3rrpTGw==U5IVgutqkmuBP4ot"
-# allowed units for foods
+# calorieNinjas quota - calls per second allowed for the API key, and how many can be made in a burst
+calNinjaRate = 1.0
+calNinjaBurst = 5
+# most calls that may queue for the quota (429 past this), and the longest a call may wait in seconds (503 past this)
+# keep calNinjaMaxQueue below calNinjaRate * calNinjaMaxWait, otherwise the wait limit is always hit first
+calNinjaMaxQueue = 4
+calNinjaMaxWait = 5.0
+# seconds clients are told to wait (Retry-After) when calorieNinjas itself fails or rate limits us
+calNinjaRetryAfter = 5
+# seconds to wait on calorieNinjas before giving up
+calNinjaTimeout = 5
+
+# ------------------------------------------------- # Nutrition provider parameters -----------------------------------------------------
+# where food nutrition comes from:
+#   "remote"   - calorieNinjas only
+#   "local"    - the bundled database in localdb.py only
+#   "fallback" - calorieNinjas, or the bundled database when calorieNinjas is shed, fails, or doesn't know the food
+#   "warm"     - the bundled database answers at once while calorieNinjas fills a cache used for later lookups
+nutritionProvider = "fallback"
+# most calorieNinjas results kept by the "warm" cache
+nutritionCacheSize = 1024
+# how close (0 - 1) a misspelled food must be to a bundled food's name to match it
+localFuzzyCutoff = 0.85
+# preparation words that may surround a bundled food's name without changing its nutrition much
+# ("grilled chicken breast" -> chicken breast) - any other extra word means the food isn't bundled
+localModifiers = ["raw", "fresh", "cooked", "grilled", "baked", "boiled", "steamed", "roasted", "plain",
+                  "sliced", "chopped", "diced", "whole", "boneless", "skinless", "ripe", "unsalted", "organic"]
+# dishes made only of a modifier + a bundled food's name that are something else entirely
+localDishes = ["grilled cheese"]
+# most foods waiting for the "warm" provider's background calorieNinjas lookups - more are dropped
+nutritionWarmQueue = 64
+# allowed units for foods, and the grams in one of each
 allowedUnits = ['grams', 'oz']
+unitGrams = {'grams': 1.0, 'oz': 28.349523125}
 # interested information from api results
 info = ["carbohydrates_total_g", "fat_total_g", "protein_g", "calories"]
 updateInfo = ["carbohydrates_g", "fats_g", "protein_g", "calories"]
@@ -18,6 +50,10 @@ objects = ["dates", "meals", "foods"]
 # list that determines what objects can have relationships
 objRel = ["dates", "meals"]
 objCombo = [("dates", "meals"), ("meals", "foods"), ("meals", "dates"), ("foods", "meals")]
+# list that determines what parent + child objects can be linked/unlinked in a batch
+objBatch = [("dates", "meals"), ("meals", "foods")]
+# most children linked/unlinked in a batch - the parent + each child is written in one commit (datastore allows 500)
+maxBatch = 250
 
 # list that determines what attributes need to be present for post/put
 requiredAttributes = {
@@ -32,6 +68,9 @@ err = {
     "missingAttributes": ({"Error": "The request object is missing at least one of the required attributes"}, 400),
     "invalidAttributes": ({"Error": "The request object doesn't support one of the entered attributes"}, 400),
     "unitIsNotAllowed": ({"Error": "The entered units aren't allowed, be sure to enter grams or pounds"}, 400),
+    "invalidDateRange": ({"Error": "The from and to dates must be formatted as YYYY-MM-DD"}, 400),
+    "unknownFood": ({"Error": "No nutrition information could be found for the entered food"}, 400),
+    "batchTooLarge": ({"Error": "At most 250 ids can be linked or unlinked in one request"}, 400),
     "duplicateDate": ({"Error": "The entered date has already been added by the current user"}, 400),
     "unauthorized": ({"Error": "The page or action you are trying to access cannot be performed without proper authentication"}, 401),
     "idChange": ({"Error": "No authority to change an ID"}, 403),
@@ -40,5 +79,7 @@ err = {
     "noPageFound": ({"Error": "This page does not exist"}, 404),
     "allModifications": ({"Error": "PUT or DELETE can be performed on a single object only, not all of them"}, 405),
     "requestMIME": ({"Error": "Client requested an unsupported MIME type"}, 406),
-    "codeFail": ({"Error": "Generic response for failures within the code..."} , 500)
+    "nutritionRateLimited": ({"Error": "Too many nutrition lookups right now, please try again shortly"}, 429),
+    "codeFail": ({"Error": "Generic response for failures within the code..."} , 500),
+    "nutritionUnavailable": ({"Error": "The nutrition service is unavailable, please try again later"}, 503)
 }
\ No newline at end of file
@@ -0,0 +1,211 @@
+"""
+Local nutrition database, used instead of or alongside calorieninjas (see const.nutritionProvider)
+
+data/foods.csv holds approximate carbohydrates, fat, protein + calories per 100 grams for common foods,
+rounded from USDA FoodData Central (SR Legacy) figures for the usual cooked/raw form of each food.
+It's compiled into data/foods.bin, which is memory-mapped so only the name index is kept in memory:
+    header   magic "NUTR", version, reserved, count                     ("<4sHHI", 12 bytes)
+    records  name offset, name length, reserved, carbs, fat, protein, kcal ("<IHH4f", 24 bytes each)
+    names    utf-8 names, sorted
+Rebuild foods.bin after editing foods.csv, and check the name matching, from the repository root:
+    python -m Blueprints.api.localdb build
+    python -m Blueprints.api.localdb check
+"""
+import csv
+import difflib
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+from functools import lru_cache
+
+import Blueprints.api.const as const
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+MAGIC = b"NUTR"
+VERSION = 1
+HEADER = struct.Struct("<4sHHI")
+RECORD = struct.Struct("<IHH4f")
+
+def normalize(food: str) -> str:
+    """
+    Function that turns a food name into its index key - lowercase, singular words in sorted order
+    so "Grilled Chicken Breasts" and "chicken breast, grilled" share a key
+    """
+    words = []
+    for word in re.findall(r"[a-z0-9]+", food.lower()):
+        if word.endswith("ies") and len(word) > 4:
+            word = word[:-3] + "y"
+        elif word.endswith("oes"):
+            word = word[:-2]
+        elif word.endswith("s") and not word.endswith(("ss", "us", "is")):
+            word = word[:-1]
+        words.append(word)
+
+    return " ".join(sorted(words))
+
+def build(csvPath: str = os.path.join(DATA, "foods.csv"), binPath: str = os.path.join(DATA, "foods.bin")) -> int:
+    """
+    Function that compiles the csv of foods into the binary format read by LocalDB.
+    Returns the number of foods written
+    """
+    with open(csvPath, newline="") as csvFile:
+        rows = sorted(csv.DictReader(csvFile), key=lambda row: row["name"])
+
+    records = b""
+    names = b""
+    for row in rows:
+        name = row["name"].encode("utf-8")
+        values = [float(row[column]) for column in ["carbohydrates_g", "fat_g", "protein_g", "calories"]]
+        records += RECORD.pack(len(names), len(name), 0, *values)
+        names += name
+
+    with open(binPath, "wb") as binFile:
+        binFile.write(HEADER.pack(MAGIC, VERSION, 0, len(rows)) + records + names)
+
+    return len(rows)
+
+class LocalDB:
+    """
+    Memory-mapped food database with a normalized name index
+    """
+    def __init__(self, path: str = os.path.join(DATA, "foods.bin")):
+        with open(path, "rb") as binFile:
+            self._mm = mmap.mmap(binFile.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, _, self.count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} isn't a version {VERSION} nutrition database")
+        self._names = HEADER.size + self.count * RECORD.size
+
+        # normalized name -> record
+        self._index = {}
+        for record in range(self.count):
+            self._index.setdefault(normalize(self.name(record)), record)
+        self._keys = list(self._index)
+        self._modifiers = set(normalize(word) for word in const.localModifiers)
+        self._dishes = set(normalize(dish) for dish in const.localDishes)
+
+    def name(self, record: int) -> str:
+        """
+        Returns the food name of the record
+        """
+        offset, length, _ = RECORD.unpack_from(self._mm, HEADER.size + record * RECORD.size)[:3]
+        start = self._names + offset
+        return self._mm[start:start + length].decode("utf-8")
+
+    def values(self, record: int) -> tuple:
+        """
+        Returns (carbohydrates, fat, protein, calories) per 100 grams for the record
+        """
+        return RECORD.unpack_from(self._mm, HEADER.size + record * RECORD.size)[3:]
+
+    @lru_cache(maxsize=1024)
+    def match(self, food: str):
+        """
+        Returns the record that best matches the food, or None.
+        Tries the exact normalized name, then a close spelling, then the name with its
+        const.localModifiers removed (e.g. "grilled chicken breast" -> "chicken breast").
+        Any other extra word is a miss - "apple pie" isn't an apple
+        """
+        key = normalize(food)
+        if key in self._index:
+            return self._index[key]
+
+        close = difflib.get_close_matches(key, self._keys, n=1, cutoff=const.localFuzzyCutoff)
+        if close:
+            return self._index[close[0]]
+
+        if key in self._dishes:
+            return None
+        stripped = " ".join(word for word in key.split() if word not in self._modifiers)
+        if stripped and stripped != key and stripped in self._index:
+            return self._index[stripped]
+
+        return None
+
+    def lookup(self, amount, units: str, food: str):
+        """
+        Returns the nutrition of amount [units] of the food in the same shape as calorieninjas,
+        or None if the food isn't in the database
+        """
+        record = self.match(food)
+        if record is None:
+            return None
+
+        grams = float(amount) * const.unitGrams[units]
+        carbs, fat, protein, calories = (round(value * grams / 100, 1) for value in self.values(record))
+        return {
+            "items": [
+                {
+                    "name": self.name(record),
+                    "serving_size_g": round(grams, 1),
+                    "carbohydrates_total_g": carbs,
+                    "fat_total_g": fat,
+                    "protein_g": protein,
+                    "calories": calories
+                }
+            ]
+        }
+
+# (food, expected bundled food or None) checked by "python -m Blueprints.api.localdb check"
+CHECKS = [
+    ("banana", "banana"),
+    ("Strawberries", "strawberries"),
+    ("bananna", "banana"),
+    ("grilled chicken breast", "chicken breast"),
+    ("chicken breasts, grilled", "chicken breast"),
+    ("boiled eggs", "egg"),
+    ("baked potato", "potato"),
+    ("butter chicken", None),
+    ("sugar free jello", None),
+    ("apple pie", None),
+    ("pineapple juice", None),
+    ("grilled cheese", None),
+    ("bread crumbs", None),
+    ("frozen yogurt", None),
+    ("peanut butter cookies", None),
+    ("dragonfruit smoothie bowl", None)
+]
+
+def check(db) -> list:
+    """
+    Function that returns the CHECKS the database gets wrong as (food, expected, matched)
+    """
+    failures = []
+    for food, expected in CHECKS:
+        record = db.match(food)
+        matched = None if record is None else db.name(record)
+        if matched != expected:
+            failures.append((food, expected, matched))
+
+    return failures
+
+# database - opened on first use rather than at import to keep cold starts short
+_db = None
+_dbLock = threading.Lock()
+
+def getDB() -> LocalDB:
+    """
+    Function that returns the shared local database, opening it on the first call
+    """
+    global _db
+    with _dbLock:
+        if _db is None:
+            _db = LocalDB()
+    return _db
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ["build"]:
+        print(f"wrote {build()} foods to {os.path.join(DATA, 'foods.bin')}")
+    elif sys.argv[1:] == ["check"]:
+        failures = check(LocalDB())
+        for food, expected, matched in failures:
+            print(f"{food!r}: expected {expected}, matched {matched}")
+        if failures:
+            sys.exit(1)
+        print(f"all {len(CHECKS)} checks passed")
+    else:
+        sys.exit("usage: python -m Blueprints.api.localdb build|check")
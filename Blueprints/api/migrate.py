@@ -0,0 +1,125 @@
+"""
+Migration of the relationship properties to the compact representation in relations.py
+
+Rewrites every foods, meals and dates entity whose lists still hold {"id": n} embedded entities
+(or repeated ids) as sorted, unique integer ids, [batch] entities per put_multi.
+Meals + dates that had a repeated id were double counting its nutrition, so they are recomputed,
+along with any date holding one of those meals.
+Dates stored before isoDate was added are given one, and every date gets its owner/isoDate marker
+(see putDate in views.py) so the duplicate check and date range queries find it. Run from the repository root:
+    python -m Blueprints.api.migrate --dry-run
+    python -m Blueprints.api.migrate --batch 500
+"""
+import argparse
+import datetime
+
+import Blueprints.api.relations as relations
+from Blueprints.api.views import getClient, updateNutritionInfo, dateMarkerKey
+
+# children before parents so the recomputed meals are used by their dates
+order = ["foods", "meals", "dates"]
+props = {"foods": ["meals"], "meals": ["foods", "dates"], "dates": ["meals"]}
+
+def migrateKind(obj: str, batch: int, dryRun: bool, changedMeals: set) -> int:
+    """
+    Function that rewrites the obj entities that aren't compact yet, a page of [batch] at a time.
+    Returns the number of entities that were (or would be) rewritten
+    """
+    client = getClient()
+    query = client.query(kind=obj)
+    migrated = 0
+    cursor = None
+
+    while True:
+        lIterator = query.fetch(limit=batch, start_cursor=cursor)
+        page = list(next(lIterator.pages))
+        changed = []
+
+        for objItem in page:
+            stale = obj == "dates" and changedMeals.intersection(relations.getIds(objItem, "meals"))
+            if all(relations.isCompact(objItem, prop) for prop in props[obj]) and not stale:
+                continue
+
+            # a repeated id was counted more than once, so the nutrition needs recomputing
+            recompute = stale or any(len(objItem.get(prop) or []) != len(relations.getIds(objItem, prop)) for prop in props[obj])
+            for prop in props[obj]:
+                relations.linkIds(objItem, prop, [])
+
+            if recompute and obj in ["meals", "dates"]:
+                objItem = updateNutritionInfo(objItem, obj)
+                if obj == "meals":
+                    changedMeals.add(objItem.key.id)
+
+            changed.append(objItem)
+
+        # stay under datastore's 500 writes per commit whatever --batch is
+        if not dryRun:
+            for start in range(0, len(changed), 500):
+                client.put_multi(changed[start:start + 500])
+        migrated += len(changed)
+
+        cursor = lIterator.next_page_token
+        if not cursor:
+            return migrated
+
+def backfillDates(batch: int, dryRun: bool) -> int:
+    """
+    Function that adds isoDate to the dates missing it + the markers missing for any date, a page of [batch] at a time.
+    Returns the number of dates that were (or would be) backfilled
+    """
+    from google.cloud import datastore
+    client = getClient()
+    query = client.query(kind="dates")
+    backfilled = 0
+    cursor = None
+
+    while True:
+        lIterator = query.fetch(limit=batch, start_cursor=cursor)
+        page = list(next(lIterator.pages))
+        changed = []
+        dateIds = set()
+
+        # older dates only have year + day_number
+        for objItem in page:
+            if not objItem.get("isoDate"):
+                date = datetime.datetime.strptime(objItem["year"] + " " + objItem["day_number"], "%Y %j")
+                objItem["isoDate"] = date.strftime("%Y-%m-%d")
+                changed.append(objItem)
+                dateIds.add(objItem.key.id)
+
+        # markers that already exist are kept - if an owner has two dates on a day, the first one keeps it
+        markerKeys = {dateMarkerKey(objItem["owner"], objItem["isoDate"]): objItem for objItem in reversed(page)}
+        existing = set(marker.key for marker in client.get_multi(list(markerKeys)))
+        for markerKey, objItem in markerKeys.items():
+            if markerKey not in existing:
+                marker = datastore.Entity(key=markerKey)
+                marker["date"] = objItem.key.id
+                changed.append(marker)
+                dateIds.add(objItem.key.id)
+
+        # a page can need up to two writes per date - stay under datastore's 500 writes per commit
+        if not dryRun:
+            for start in range(0, len(changed), 500):
+                client.put_multi(changed[start:start + 500])
+        backfilled += len(dateIds)
+
+        cursor = lIterator.next_page_token
+        if not cursor:
+            return backfilled
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, default=500, help="entities read + written per call")
+    parser.add_argument("--dry-run", action="store_true", help="count the entities to migrate without writing them")
+    args = parser.parse_args()
+
+    changedMeals = set()
+    for obj in order:
+        migrated = migrateKind(obj, args.batch, args.dry_run, changedMeals)
+        print(f"{obj}: {migrated} {'to migrate' if args.dry_run else 'migrated'}")
+
+    backfilled = backfillDates(args.batch, args.dry_run)
+    print(f"dates: {backfilled} {'to backfill' if args.dry_run else 'backfilled'} with isoDate/markers")
+
+if __name__ == '__main__':
+    main()
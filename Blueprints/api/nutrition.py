@@ -0,0 +1,309 @@
+"""
+Nutrition lookups for foods - from calorieninjas, the local database in localdb.py, or both (const.nutritionProvider)
+
+Identical queries that are in flight at the same time share a single upstream call (single-flight)
+and every upstream call must take a token from a token bucket sized to the API key's quota.
+Requests that can't get a token soon enough are shed with a 429/503 instead of failing.
+State is per process, so each instance keeps its own bucket, cache and metrics.
+"""
+from collections import OrderedDict
+import math
+import queue
+import threading
+import time
+
+import Blueprints.api.const as const
+import Blueprints.api.localdb as localdb
+
+class Shed(Exception):
+    """
+    Raised when a nutrition lookup is refused or fails - [errKey] is the key of the response in const.err
+    and [retryAfter] the seconds the client should wait before retrying, if retrying can help
+    """
+    def __init__(self, errKey: str, retryAfter: int = None):
+        super().__init__(errKey)
+        self.errKey = errKey
+        self.retryAfter = retryAfter
+
+class TokenBucket:
+    """
+    Token bucket that refills [rate] tokens per second up to [capacity].
+    Callers that find the bucket empty queue in arrival order for the next token,
+    unless [maxQueue] callers are already waiting (429) or the wait would exceed [maxWait] seconds (503)
+    """
+    def __init__(self, rate: float, capacity: int, maxQueue: int, maxWait: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.maxQueue = maxQueue
+        self.maxWait = maxWait
+
+        self._lock = threading.Lock()
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+
+        # metrics
+        self.queueDepth = 0
+        self.peakQueueDepth = 0
+        self.waited = 0
+        self.waitTotal = 0.0
+        self.waitMax = 0.0
+        self.shed = {"queueFull": 0, "waitTooLong": 0}
+
+    def acquire(self) -> float:
+        """
+        Take a token, sleeping until one is available - returns the seconds spent waiting
+        """
+        with self._lock:
+            # refill the bucket for the time passed since the last call
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+            # reserve a token - a negative balance is the queue of callers waiting for one
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+            if wait:
+                # a retry after the current wait will find the queued callers served
+                retryAfter = math.ceil(wait)
+                if self.queueDepth >= self.maxQueue:
+                    self._tokens += 1
+                    self.shed["queueFull"] += 1
+                    raise Shed("nutritionRateLimited", retryAfter)
+                if wait > self.maxWait:
+                    self._tokens += 1
+                    self.shed["waitTooLong"] += 1
+                    raise Shed("nutritionUnavailable", retryAfter)
+
+                self.queueDepth += 1
+                self.peakQueueDepth = max(self.peakQueueDepth, self.queueDepth)
+
+        if wait:
+            time.sleep(wait)
+            with self._lock:
+                self.queueDepth -= 1
+                self.waited += 1
+                self.waitTotal += wait
+                self.waitMax = max(self.waitMax, wait)
+
+        return wait
+
+class _Call:
+    """
+    A single upstream call that other callers with the same key can wait on
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one call of the function
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+        # metrics
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn):
+        """
+        Call fn() for [key], or wait for and share the result of a call already in flight for [key]
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
+
+bucket = TokenBucket(const.calNinjaRate, const.calNinjaBurst, const.calNinjaMaxQueue, const.calNinjaMaxWait)
+flight = SingleFlight()
+
+# calorieninjas results filled in the background for the "warm" provider, by one worker thread
+cache = OrderedDict()
+cacheLock = threading.Lock()
+warmQueue = queue.Queue(maxsize=const.nutritionWarmQueue)
+warmWorker = None
+warmLock = threading.Lock()
+
+# metrics
+providerCounts = {"local": 0, "localMisses": 0, "fallbacks": 0, "cacheHits": 0, "warmed": 0, "warmDropped": 0,
+                  "warmErrors": 0}
+
+def fetch(query: str) -> dict:
+    """
+    Function that makes the rate limited call to calorieninjas for [query]
+    and returns the decoded results
+    """
+    import requests
+
+    bucket.acquire()
+    try:
+        response = requests.get('https://api.calorieninjas.com/v1/nutrition',
+                                params={'query': query},
+                                headers={'X-Api-Key': const.calNinjaKey},
+                                timeout=const.calNinjaTimeout)
+    except requests.RequestException:
+        raise Shed("nutritionUnavailable", const.calNinjaRetryAfter)
+
+    # the key's quota was used up elsewhere - pass the 429 along
+    if response.status_code == 429:
+        retryAfter = response.headers.get("Retry-After", "")
+        raise Shed("nutritionRateLimited", int(retryAfter) if retryAfter.isdigit() else const.calNinjaRetryAfter)
+    if response.status_code != 200:
+        raise Shed("nutritionUnavailable", const.calNinjaRetryAfter)
+
+    # a 200 that isn't a JSON object is a calorieninjas failure too
+    try:
+        results = response.json()
+        items = results.get("items")
+    except (ValueError, AttributeError):
+        raise Shed("nutritionUnavailable", const.calNinjaRetryAfter)
+    if not items:
+        raise Shed("unknownFood")
+
+    return results
+
+def remote(query: str) -> dict:
+    """
+    Function that returns the calorieninjas results for [query],
+    sharing one upstream call between identical queries made at the same time
+    """
+    return flight.do(query.strip().lower(), lambda: fetch(query))
+
+def local(amount, units: str, food: str) -> dict:
+    """
+    Function that returns the local database's results for amount [units] of the food
+    """
+    results = localdb.getDB().lookup(amount, units, food)
+    if not results:
+        providerCounts["localMisses"] += 1
+        raise Shed("unknownFood")
+
+    providerCounts["local"] += 1
+    return results
+
+def warm() -> None:
+    """
+    Function that stores the calorieninjas results for each queued query in the cache - run by the warm worker
+    """
+    while True:
+        query = warmQueue.get()
+
+        # foreground lookups waiting on the quota come first
+        if bucket.queueDepth:
+            providerCounts["warmDropped"] += 1
+            continue
+
+        try:
+            results = remote(query)
+        except Shed:
+            continue
+        # anything unexpected is counted rather than ending the worker
+        except Exception:
+            providerCounts["warmErrors"] += 1
+            continue
+
+        with cacheLock:
+            cache[query.strip().lower()] = results
+            while len(cache) > const.nutritionCacheSize:
+                cache.popitem(last=False)
+        providerCounts["warmed"] += 1
+
+def queueWarm(query: str) -> None:
+    """
+    Function that queues [query] for the warm worker, starting it on the first call
+    (or again if it has died). Queries are dropped when the queue is full
+    """
+    global warmWorker
+    with warmLock:
+        if warmWorker is None or not warmWorker.is_alive():
+            warmWorker = threading.Thread(target=warm, daemon=True)
+            warmWorker.start()
+
+    try:
+        warmQueue.put_nowait(query)
+    except queue.Full:
+        providerCounts["warmDropped"] += 1
+
+def lookup(amount, units: str, food: str) -> dict:
+    """
+    Function that returns the nutrition results for amount [units] of the food
+    from the provider(s) chosen by const.nutritionProvider
+    """
+    query = str(amount) + units + ' ' + food
+
+    if const.nutritionProvider == "local":
+        return local(amount, units, food)
+
+    if const.nutritionProvider == "warm":
+        with cacheLock:
+            results = cache.get(query.strip().lower())
+            if results:
+                cache.move_to_end(query.strip().lower())
+        if results:
+            providerCounts["cacheHits"] += 1
+            return results
+
+        # answer from the local database now + fetch calorieninjas' results for next time
+        try:
+            results = local(amount, units, food)
+        except Shed:
+            return remote(query)
+        queueWarm(query)
+        return results
+
+    try:
+        return remote(query)
+    except Shed:
+        if const.nutritionProvider != "fallback":
+            raise
+        results = localdb.getDB().lookup(amount, units, food)
+        if not results:
+            raise
+        providerCounts["fallbacks"] += 1
+        return results
+
+def metrics() -> dict:
+    """
+    Function that returns the queue depth, wait time and coalescing metrics
+    """
+    return {
+        "queueDepth": bucket.queueDepth,
+        "peakQueueDepth": bucket.peakQueueDepth,
+        "waited": bucket.waited,
+        "waitAvgSeconds": bucket.waitTotal / bucket.waited if bucket.waited else 0.0,
+        "waitMaxSeconds": bucket.waitMax,
+        "shed": dict(bucket.shed),
+        "calls": flight.calls,
+        "coalesced": flight.coalesced,
+        "provider": const.nutritionProvider,
+        "providerCounts": dict(providerCounts),
+        "cacheSize": len(cache),
+        "warmQueueDepth": warmQueue.qsize()
+    }
@@ -0,0 +1,74 @@
+"""
+Helpers for the relationship properties (dates' meals, meals' foods + dates, foods' meals)
+
+Relationships are stored as sorted lists of unique integer ids, which datastore indexes,
+so membership can be queried (e.g. all meals with a given food) and a pair can't be linked twice.
+Entities written before this change stored lists of {"id": n} embedded entities - every reader
+here accepts both, and migrate.py rewrites the old entities in batches.
+"""
+from bisect import bisect_left
+
+import Blueprints.api.const as const
+
+def getIds(objItem, prop: str) -> list:
+    """
+    Function that returns the sorted, unique ids in objItem's [prop] list,
+    reading either integer ids or legacy {"id": n} embedded entities
+    """
+    items = objItem.get(prop) or []
+
+    # compact lists are already kept sorted + unique by linkIds/unlinkIds
+    if not items or not isinstance(items[0], dict):
+        return items
+
+    return sorted(set(int(item["id"]) for item in items))
+
+def isCompact(objItem, prop: str) -> bool:
+    """
+    Function that checks if objItem's [prop] list is already stored as sorted, unique integer ids
+    """
+    items = objItem.get(prop) or []
+    return all(type(item) is int for item in items) and items == sorted(set(items))
+
+def hasId(objItem, prop: str, id: int) -> bool:
+    """
+    Function that checks if id is in objItem's [prop] list
+    """
+    ids = getIds(objItem, prop)
+    i = bisect_left(ids, int(id))
+    return i < len(ids) and ids[i] == int(id)
+
+def linkIds(objItem, prop: str, ids: list) -> None:
+    """
+    Function that adds the ids to objItem's [prop] list, ignoring any that are already linked
+    """
+    linked = list(getIds(objItem, prop))
+    for id in ids:
+        i = bisect_left(linked, int(id))
+        if i == len(linked) or linked[i] != int(id):
+            linked.insert(i, int(id))
+
+    objItem[prop] = linked
+
+def unlinkIds(objItem, prop: str, ids: list) -> None:
+    """
+    Function that removes the ids from objItem's [prop] list
+    """
+    linked = list(getIds(objItem, prop))
+    for id in ids:
+        i = bisect_left(linked, int(id))
+        if i < len(linked) and linked[i] == int(id):
+            del linked[i]
+
+    objItem[prop] = linked
+
+def withSelf(objItem, urlRoot: str) -> None:
+    """
+    Function that replaces each relationship list in objItem with
+    a list of {"id", "self"} objects for the JSON response - not stored in datastore
+    """
+    # check for all objs
+    for item in const.objects:
+        # check for key prior to indexing
+        if item in objItem.keys():
+            objItem[item] = [{"id": id, "self": urlRoot + item + "/" + str(id)} for id in getIds(objItem, item)]
@@ -1,14 +1,27 @@
-from google.cloud import datastore
 from flask import Blueprint, Flask, request, abort, render_template
 import datetime
 import json
-import requests
 
 import Blueprints.api.const as const
+import Blueprints.api.nutrition as nutrition
+import Blueprints.api.relations as relations
 import Blueprints.auth.views as authHelp
 
 api = Blueprint('api', __name__, template_folder='templates')
-client = datastore.Client()
+
+# datastore client - created on first use rather than at import to keep cold starts short
+_client = None
+
+def getClient():
+    """
+    Function that returns the shared datastore client,
+    importing google.cloud.datastore and creating the client on the first call
+    """
+    global _client
+    if _client is None:
+        from google.cloud import datastore
+        _client = datastore.Client()
+    return _client
 
 def attributesIncorrect(requestData: request, obj: str) -> bool:
     """
@@ -27,16 +40,18 @@ def attributesIncorrect(requestData: request, obj: str) -> bool:
 
 def getNutritionInfo(requestData: request) -> request:
     """
-    Function that makes an API call to calorieninjas with the user's given amount, units, and food,
+    Function that looks up the user's given amount, units, and food with calorieninjas and/or the local database,
     which then returns an updated request object w/ the new relevant information
+    If the lookup is shed, fails, or the food isn't found, returns an error
     """
-    # create the url
-    api_url = 'https://api.calorieninjas.com/v1/nutrition?query='
-    query = str(requestData["amount"]) + requestData["units"] + ' ' + requestData["food"]
-    
-    # make the request to calorieninjas
-    response = requests.get(api_url + query, headers={'X-Api-Key': const.calNinjaKey})
-    results = response.json()
+    # make the request to the nutrition provider - calorieninjas calls are shared with identical queries + rate limited
+    try:
+        results = nutrition.lookup(requestData["amount"], requestData["units"], requestData["food"])
+    except nutrition.Shed as shed:
+        # tell the client when to try again if the lookup was shed
+        if shed.retryAfter:
+            return const.err[shed.errKey] + ({"Retry-After": str(shed.retryAfter)},)
+        return const.err[shed.errKey]
 
     # add the food information to my requestData
     for item in const.info:
@@ -45,11 +60,47 @@ def getNutritionInfo(requestData: request) -> request:
     # return our updated requestData
     return requestData 
 
+def dateMarkerKey(owner: str, isoDate: str):
+    """
+    Function that returns the key of the marker entity recording which date
+    the owner has on isoDate (YYYY-MM-DD) - named from owner + isoDate so it's found with a single get
+    """
+    return getClient().key("dateMarkers", (owner or "") + "|" + isoDate)
+
+def putDate(objItem, oldIsoDate: str = None) -> bool:
+    """
+    Function that stores the date + moves its owner/isoDate marker in one transaction,
+    so two requests can't both add the same date for an owner.
+    If the owner already has another date on that day, nothing is stored and returns False
+    """
+    from google.cloud import datastore
+    client = getClient()
+    markerKey = dateMarkerKey(objItem["owner"], objItem["isoDate"])
+
+    with client.transaction():
+        marker = client.get(markerKey)
+        if marker and marker["date"] != objItem.key.id:
+            return False
+
+        # the date moved to a new day - free up the old one, unless the marker belongs to another date
+        if oldIsoDate and oldIsoDate != objItem["isoDate"]:
+            oldMarkerKey = dateMarkerKey(objItem["owner"], oldIsoDate)
+            oldMarker = client.get(oldMarkerKey)
+            if oldMarker and oldMarker["date"] == objItem.key.id:
+                client.delete(oldMarkerKey)
+
+        marker = datastore.Entity(key=markerKey)
+        marker["date"] = objItem.key.id
+        client.put_multi([marker, objItem])
+
+    return True
+
 def updateNutritionInfo(requestData: request, obj: str) -> request:
     """
     Function that updates the items in const.info
     info = ["carbohydrates_g", "fats_g", "protein_g", "calories"]
     """
+    client = getClient()
     if obj == "meals":
         obj2 = "foods"
     elif obj == "dates":
@@ -59,12 +110,11 @@ def updateNutritionInfo(requestData: request, obj: str) -> request:
     for info in const.updateInfo:
         requestData[info] = 0
 
+    # get the specific info for all of the foods/meals in one call
+    objKeys = [client.key(obj2, id) for id in relations.getIds(requestData, obj2)]
+
     # iterate through the requestData's list of foods or meals
-    for item in requestData[obj2]:
-        # get the specific info for that food/meal
-        objKey = client.key(obj2, int(item["id"]))
-        objItem = client.get(key=objKey)
-        
+    for objItem in client.get_multi(objKeys):
         # iterate through the desired info and update info
         for info in const.updateInfo:
             requestData[info] += objItem[info]
@@ -76,36 +126,48 @@ def checkNeedUpdate(obj: str, id: int) -> None:
     Function that checks if any of our updated IDs were related to another object
     If so, update that object with the new updated ID info
     """
+    client = getClient()
     if obj == "meals":
         obj2 = "foods"
     elif obj == "dates":
         obj2 = "meals"
-    query = client.query(kind=obj)
-    results = list(query.fetch())
+    # only fetch the objects whose (indexed) list contains the updated id -
+    # compact lists hold the id itself, lists not migrated yet hold {"id": n} entities
+    results = {}
+    for prop in [obj2, obj2 + ".id"]:
+        query = client.query(kind=obj)
+        query.add_filter(prop, "=", int(id))
+        for result in query.fetch():
+            results[result.key.id] = result
+    results = list(results.values())
 
-    # iterate through each result
+    # iterate through each result - the updated object is in the list, update the related object's info!
     for result in results:
-        if result[obj2]:
-            # if the updated object is in the list, update the related object's info!
-            for item in result[obj2]:
-                if item["id"] == int(id):
-                    result = updateNutritionInfo(result, obj)
-                    client.put(result)
+        result = updateNutritionInfo(result, obj)
+        client.put(result)
 
-                    # special scenario - if food is updated in meals, check for dates that need their meals updated
-                    if obj == "meals":
-                        checkNeedUpdate("dates", int(result.key.id))                        
+        # special scenario - if food is updated in meals, check for dates that need their meals updated
+        if obj == "meals":
+            checkNeedUpdate("dates", int(result.key.id))
 
 @api.route('/')
 def index():
     return render_template('apiIntro.html')
 
+@api.route('/nutrition/metrics', methods=['GET'])
+def nutritionMetrics():
+    """
+    Function that returns the calorieninjas queue depth, wait time and coalescing metrics
+    """
+    return json.dumps(nutrition.metrics()), 200
+
 @api.route('/<obj>', methods=['POST','GET'])
 def postOneGetAll(obj: str):
     """
     This function allows the creation of our specific objects [obj]
     or to view all the objects.
     """
+    client = getClient()
     # validate client is only asking for specific objects
     if obj not in const.objects:
         abort(404)
@@ -132,15 +194,20 @@ def postOneGetAll(obj: str):
         if attributesIncorrect(content, obj):
             return const.err["missingAttributes"]
         
+        from google.cloud import datastore
         newObj = datastore.entity.Entity(key=client.key(obj))
 
         # update each newObj in accordance to the obj
         if obj == "dates":
             # create datetime object
             date = datetime.datetime(int(content["year"]), int(content["month"]), int(content["day"]))
+
+            # the id is needed up front for the date's marker
+            newObj.key = client.allocate_ids(client.key(obj), 1)[0]
             newObj.update(
                 {
                     "date": date.strftime("%x"),
+                    "isoDate": date.strftime("%Y-%m-%d"),
                     "weekday": date.strftime("%A"),
                     "week": date.strftime("%W"),
                     "year": date.strftime("%Y"),
@@ -176,6 +243,9 @@ def postOneGetAll(obj: str):
             
             # make call to get food informations
             content = getNutritionInfo(content)
+            # error code was returned
+            if type(content) is tuple:
+                return content
 
             newObj.update(
                 {
@@ -191,8 +261,12 @@ def postOneGetAll(obj: str):
             )
         # add an owner to object if 'Authorization' header was set
         newObj.update({"owner": payload["sub"] if payload else None})
-        # place into datastore
-        client.put(newObj)
+        # place into datastore - dates are checked against the owner's other dates as they're stored
+        if obj == "dates":
+            if not putDate(newObj):
+                return const.err["duplicateDate"]
+        else:
+            client.put(newObj)
 
         # add "id" and "self" to the results - not stored in datastore
         newObj["id"] = newObj.key.id
@@ -202,6 +276,21 @@ def postOneGetAll(obj: str):
 
     elif request.method == 'GET':
         query = client.query(kind=obj)
+        nextArgs = ""
+
+        # dates can be fetched for a range w/ ?from=YYYY-MM-DD&to=YYYY-MM-DD - one indexed query on owner + isoDate
+        if obj == "dates" and ("from" in request.args or "to" in request.args):
+            try:
+                for arg in ["from", "to"]:
+                    if arg in request.args:
+                        isoDate = datetime.datetime.strptime(request.args[arg], "%Y-%m-%d").strftime("%Y-%m-%d")
+                        query.add_filter("isoDate", ">=" if arg == "from" else "<=", isoDate)
+                        nextArgs += "&" + arg + "=" + isoDate
+            except ValueError:
+                return const.err["invalidDateRange"]
+
+            query.add_filter("owner", "=", payload["sub"] if payload else None)
+            query.order = ["isoDate"]
         
         # pagination - save the next_url as a key in the output
         # retrieve limit and offset by the URL, otherwise default to 5 and 0, respectively
@@ -223,20 +312,15 @@ def postOneGetAll(obj: str):
             result["id"] = result.key.id
             result["self"] = request.base_url + "/" + str(result.key.id)
 
-            # check for all objs
-            for item in const.objects:
-                # check for key prior to indexing
-                if item in result.keys():
-                    # add self to all list items
-                    for res in result[item]:
-                        res["self"] = request.url_root + item + "/" + str(res["id"])
+            # add self to all list items
+            relations.withSelf(result, request.url_root)
 
         output = {str(obj): newResults}
         
         # if more than 'offset' results are available, set the "next" value in the output
         if lIterator.next_page_token:
             nextOffset = qOffset + qLimit
-            nextUrl = request.base_url + "?limit=" + str(qLimit) + "&offset=" + str(nextOffset)
+            nextUrl = request.base_url + "?limit=" + str(qLimit) + "&offset=" + str(nextOffset) + nextArgs
             output["next"] = nextUrl
 
         return json.dumps(output), 200
@@ -251,6 +335,7 @@ def deleteGetPutOneItem(obj: str, id: str):
     or to view a specific object, or to edit a specific object
     with a specific id [id]
     """
+    client = getClient()
     # validate client is only asking for specific objects
     if obj not in const.objects:
         abort(404)
@@ -286,12 +371,10 @@ def deleteGetPutOneItem(obj: str, id: str):
             # check for key prior to indexing
             if item in objItem.keys():
                 # iterate through the list of object ids - all of these items reference our specified id
-                for res in objItem[item]:
-                    itemKey = client.key(item, int(res["id"]))
-                    changedItem = client.get(key=itemKey)
-                    
+                itemKeys = [client.key(item, itemId) for itemId in relations.getIds(objItem, item)]
+                for changedItem in client.get_multi(itemKeys):
                     # remove the reference to the specified id
-                    changedItem[obj].remove({"id": int(id)})
+                    relations.unlinkIds(changedItem, obj, [int(id)])
                     
                     # update our dates' or meals' nutritional information
                     if obj in const.objRel:                    
@@ -300,6 +383,13 @@ def deleteGetPutOneItem(obj: str, id: str):
                     # make our update
                     client.put(changedItem)
 
+        # free up the date's day for its owner, unless the marker belongs to another date
+        if obj == "dates" and objItem.get("isoDate"):
+            markerKey = dateMarkerKey(objItem["owner"], objItem["isoDate"])
+            marker = client.get(markerKey)
+            if marker and marker["date"] == int(id):
+                client.delete(markerKey)
+
         client.delete(objKey)
         return "", 204
 
@@ -312,13 +402,8 @@ def deleteGetPutOneItem(obj: str, id: str):
         objItem["id"] = objItem.key.id
         objItem["self"] = request.base_url
 
-        # check for all objs
-        for item in const.objects:
-            # check for key prior to indexing
-            if item in objItem.keys():
-                # add self to all list items
-                for res in objItem[item]:
-                    res["self"] = request.url_root + item + "/" + str(res["id"])
+        # add self to all list items
+        relations.withSelf(objItem, request.url_root)
 
         return json.dumps(objItem), 200
     
@@ -334,16 +419,21 @@ def deleteGetPutOneItem(obj: str, id: str):
 
         if obj == "dates":
             date = datetime.datetime(int(content["year"]), int(content["month"]), int(content["day"]))
+            oldIsoDate = objItem.get("isoDate")
+
             objItem.update(
                 {
                     "date": date.strftime("%x"),
+                    "isoDate": date.strftime("%Y-%m-%d"),
                     "weekday": date.strftime("%A"),
                     "week": date.strftime("%W"),
                     "year": date.strftime("%Y"),
                     "day_number": date.strftime("%j")
                 }
             )
-            client.put(objItem)
+            # check that the owner doesn't have another date on the new day as it's stored
+            if not putDate(objItem, oldIsoDate):
+                return const.err["duplicateDate"]
 
         elif obj == "meals":
             objItem.update(
@@ -363,6 +453,9 @@ def deleteGetPutOneItem(obj: str, id: str):
             
             # make call to get food informations
             content = getNutritionInfo(content)
+            # error code was returned
+            if type(content) is tuple:
+                return content
             objItem.update(
                 {
                     "food": content["food"],
@@ -379,12 +472,13 @@ def deleteGetPutOneItem(obj: str, id: str):
         
         return "", 204
 
-@api.route('/<obj>/<id1>/<id2>', methods=['PATCH', 'DELETE'])
+@api.route('/<obj>/<id1>/<int:id2>', methods=['PATCH', 'DELETE'])
 def patchDelete(obj: str, id1: str, id2: str):
     """
     Function that allows creating + deleting relationships 
     between a date + a meal, and a meal + a food.
     """
+    client = getClient()
     # JWT not required
     if 'Authorization' in request.headers:
         payload = authHelp.verify_jwt(request)
@@ -431,9 +525,9 @@ def patchDelete(obj: str, id1: str, id2: str):
             return const.err["unauthorized"]
 
     if request.method == 'PATCH':
-        # add references to each other
-        objItem1[obj2].append({"id": int(id2)})
-        objItem2[obj].append({"id": int(id1)})
+        # add references to each other - linking an already linked pair changes nothing
+        relations.linkIds(objItem1, obj2, [int(id2)])
+        relations.linkIds(objItem2, obj, [int(id1)])
         
         # update our dates' or meals' nutritional information
         objItem1 = updateNutritionInfo(objItem1, obj)
@@ -452,10 +546,10 @@ def patchDelete(obj: str, id1: str, id2: str):
         # check that our obj1 contains obj2
         if objItem1[obj2]:
             # if our id2 is in obj1 list, remove it, otherwise return an error
-            if {"id": int(id2)} in objItem1[obj2] and {"id": int(id1)} in objItem2[obj]:
+            if relations.hasId(objItem1, obj2, id2) and relations.hasId(objItem2, obj, id1):
                 # if dates, remove meals. if meals, remove foods.
-                objItem1[obj2].remove({"id": int(id2)})
-                objItem2[obj].remove({"id": int(id1)})
+                relations.unlinkIds(objItem1, obj2, [int(id2)])
+                relations.unlinkIds(objItem2, obj, [int(id1)])
 
                 # update our dates' or meals' nutritional information
                 objItem1 = updateNutritionInfo(objItem1, obj)
@@ -472,12 +566,94 @@ def patchDelete(obj: str, id1: str, id2: str):
                     
         return "", 204
 
+@api.route('/<obj1>/<id1>/<obj2>', methods=['PATCH', 'DELETE'])
+def batchPatchDelete(obj1: str, id1: str, obj2: str):
+    """
+    Function that allows creating + deleting many relationships at once
+    between a date + its meals, or a meal + its foods.
+    Request: JSON body with "ids", the list of meal or food ids to link/unlink
+    """
+    client = getClient()
+    # JWT not required
+    if 'Authorization' in request.headers:
+        payload = authHelp.verify_jwt(request)
+        # error code was returned
+        if type(payload) is tuple:
+            return payload
+    else:
+        payload = None
+
+    # check that given obj1 and obj2 can be linked
+    if (obj1, obj2) not in const.objBatch:
+        abort(404)
+
+    content = request.get_json()
+    if type(content) is not dict or type(content.get("ids")) is not list or not content["ids"]:
+        return const.err["missingAttributes"]
+    # every id must be a positive whole number (or a string of one) - datastore ids start at 1
+    for id2 in content["ids"]:
+        if type(id2) is not int and not (type(id2) is str and id2.isdecimal()):
+            return const.err["invalidAttributes"]
+        if int(id2) < 1:
+            return const.err["invalidAttributes"]
+    # drop repeated ids so each child is linked/unlinked once
+    ids = list(dict.fromkeys(int(id2) for id2 in content["ids"]))
+    if len(ids) > const.maxBatch:
+        return const.err["batchTooLarge"]
+
+    # get our parent + all of the children in one call
+    obj1Key = client.key(obj1, int(id1))
+    objItems = client.get_multi([obj1Key] + [client.key(obj2, id2) for id2 in ids])
+    objItem1 = next((objItem for objItem in objItems if objItem.key == obj1Key), None)
+    children = {objItem.key.id: objItem for objItem in objItems if objItem.key != obj1Key}
+
+    # check that all of the objects exist
+    if not objItem1 or len(children) != len(ids):
+        return const.err["invalidID"]
+
+    # check that each object has an owner, otherwise just continue
+    for objItem in [objItem1] + list(children.values()):
+        if objItem["owner"]:
+            # check that the objItem's owner doesn't match or no authentication provided
+            if not payload or objItem["owner"] != payload["sub"]:
+                return const.err["unauthorized"]
+
+    if request.method == 'PATCH':
+        # add references to each other - linking an already linked pair changes nothing
+        relations.linkIds(objItem1, obj2, ids)
+        for id2 in ids:
+            relations.linkIds(children[id2], obj1, [int(id1)])
+
+    elif request.method == 'DELETE':
+        # check that every child is linked to the parent before removing any of them
+        for id2 in ids:
+            if not relations.hasId(objItem1, obj2, id2) or not relations.hasId(children[id2], obj1, id1):
+                return const.err["invalidRelationship"]
+
+        # if dates, remove meals. if meals, remove foods.
+        relations.unlinkIds(objItem1, obj2, ids)
+        for id2 in ids:
+            relations.unlinkIds(children[id2], obj1, [int(id1)])
+
+    # update our dates' or meals' nutritional information once for the whole batch
+    objItem1 = updateNutritionInfo(objItem1, obj1)
+
+    # make our updates in one call
+    client.put_multi([objItem1] + list(children.values()))
+
+    # if object to associate was a meal, check if any dates need their nutritional info updated
+    if obj1 == "meals":
+        checkNeedUpdate("dates", int(id1))
+
+    return "", 204
+
 @api.route('/<obj1>/<id1>/<obj2>', methods=['GET'])
 def getRelationItems(obj1: str, id1: str, obj2: str):
     """
     Function that simply gets the list items 
     for specific combos
     """
+    client = getClient()
     # JWT not required
     if 'Authorization' in request.headers:
         payload = authHelp.verify_jwt(request)
@@ -509,7 +685,6 @@ def getRelationItems(obj1: str, id1: str, obj2: str):
             return const.err["unauthorized"]
     
     # add self to all items
-    for item in objItem[obj2]:
-        item["self"] = request.url_root + obj2 + "/" + str(item["id"])
+    relations.withSelf(objItem, request.url_root)
 
     return json.dumps({obj2: objItem[obj2]}), 200
\ No newline at end of file
@@ -1,30 +1,35 @@
-import requests
 from functools import wraps
 import json
 from six.moves.urllib.request import urlopen
-from flask_cors import cross_origin
-from jose import jwt
-from os import environ as env
-from werkzeug.exceptions import HTTPException
-from dotenv import load_dotenv, find_dotenv
-from flask import Flask, Blueprint, jsonify, redirect, render_template, session, url_for, request, _request_ctx_stack, current_app
-from authlib.integrations.flask_client import OAuth
+from flask import Blueprint, redirect, render_template, session, request, current_app
 from six.moves.urllib.parse import urlencode
 
 import Blueprints.auth.const as const
 
 auth = Blueprint('auth', __name__, template_folder='templates')
-# register the current app to apply oAuthentication
-oauth = OAuth(current_app)
-auth0 = oauth.register(
-    'auth0',
-    client_id= const.CLIENT_ID,
-    client_secret= const.CLIENT_SECRET,
-    api_base_url= f"https://{const.DOMAIN}",
-    access_token_url= f"https://{const.DOMAIN}/oauth/token",
-    authorize_url= f"https://{const.DOMAIN}/authorize",
-    client_kwargs={'scope': 'openid profile email'}
-)
+
+# auth0 client - registered on first use so authlib is only loaded by /login and /callback
+_auth0 = None
+
+def getAuth0():
+    """
+    Function that returns the auth0 OAuth client,
+    registering the current app to apply oAuthentication on the first call
+    """
+    global _auth0
+    if _auth0 is None:
+        from authlib.integrations.flask_client import OAuth
+        oauth = OAuth(current_app)
+        _auth0 = oauth.register(
+            'auth0',
+            client_id= const.CLIENT_ID,
+            client_secret= const.CLIENT_SECRET,
+            api_base_url= f"https://{const.DOMAIN}",
+            access_token_url= f"https://{const.DOMAIN}/oauth/token",
+            authorize_url= f"https://{const.DOMAIN}/authorize",
+            client_kwargs={'scope': 'openid profile email'}
+        )
+    return _auth0
 
 # This code is adapted from https://auth0.com/docs/quickstart/backend/python/01-authorization?_ga=2.46956069.349333901.1589042886-466012638.1589042885#create-the-jwt-validation-decorator
 
@@ -50,6 +55,8 @@ def verify_jwt(request) -> dict:
         token = auth_header[1]
     else:
         return const.err["noHeader"]
+
+    from jose import jwt
     
     jsonurl = urlopen("https://"+ const.DOMAIN+"/.well-known/jwks.json")
     jwks = json.loads(jsonurl.read())
@@ -101,6 +108,7 @@ def callback_handling():
     """
     Handling the callback from auth0
     """
+    auth0 = getAuth0()
     # Handles response from token endpoint
     auth0.authorize_access_token()
     resp = auth0.get('userinfo')
@@ -120,7 +128,7 @@ def login():
     """
     directs user to account creation or login
     """
-    return auth0.authorize_redirect(redirect_uri=const.CALLBACK)
+    return getAuth0().authorize_redirect(redirect_uri=const.CALLBACK)
 
 @auth.route('/dashboard')
 @requires_auth
@@ -141,7 +149,7 @@ def logout():
     session.clear()
     # Redirect user to logout endpoint
     params = {'returnTo': const.RETURN, 'client_id': const.CLIENT_ID}
-    return redirect(auth0.api_base_url + '/v2/logout?' + urlencode(params))
+    return redirect(f"https://{const.DOMAIN}" + '/v2/logout?' + urlencode(params))
 
 @auth.route('/users', methods = ["GET"])
 def getUsers():
@@ -149,6 +157,7 @@ def getUsers():
     Generate a JWT for the management access API from the Auth0 domain
     and make a call to return all user info
     """
+    import requests
     
     # Get a Management Access Token from Auth0
     base_url = f"https://{const.DOMAIN}"
@@ -181,6 +190,7 @@ def login_user():
     of a user registered with this Auth0 domain
     Response: JSON with the JWT as the value of the property id_token
     """
+    import requests
     content = request.get_json()
 
     body = {'grant_type': 'password',
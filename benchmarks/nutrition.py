@@ -0,0 +1,69 @@
+"""
+Nutrition lookup benchmark for the FitnessTracker API
+
+Compares the lookup latency of the local database (Blueprints/api/localdb.py) with calorieninjas:
+    - opening the memory-mapped database + building its name index
+    - exact, misspelled, extra-words and unknown food lookups
+    - calorieninjas round trips, only with --remote (needs network access + uses the API key's quota)
+
+Run from the repository root:
+    python benchmarks/nutrition.py
+    python benchmarks/nutrition.py --remote 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Blueprints.api.const as const
+import Blueprints.api.localdb as localdb
+
+# (label, amount, units, food) looked up in each run
+LOOKUPS = [
+    ("exact", 100, "grams", "banana"),
+    ("plural + oz", 4, "oz", "Strawberries"),
+    ("misspelled", 100, "grams", "bananna"),
+    ("extra words", 6, "oz", "grilled chicken breast"),
+    ("unknown", 100, "grams", "dragonfruit smoothie bowl")
+]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10000, help="local lookups timed per food")
+    parser.add_argument("--remote", type=int, default=0, help="calorieninjas calls timed per food (0 skips them)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    db = localdb.LocalDB()
+    print(f"open + index {db.count} foods: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    print(f"{'lookup':<12} {'food':<28} {'match':<16} {'local cold us':>13} {'local us':>9} {'remote ms':>10}")
+    for label, amount, units, food in LOOKUPS:
+        # first lookup of a name fills the match cache, later ones hit it
+        start = time.perf_counter()
+        results = db.lookup(amount, units, food)
+        coldUs = (time.perf_counter() - start) * 1e6
+        warmUs = min(timeit.repeat(lambda: db.lookup(amount, units, food), number=args.runs, repeat=3)) / args.runs * 1e6
+
+        remoteMs = "skipped"
+        if args.remote:
+            import requests
+
+            times = []
+            for _ in range(args.remote):
+                start = time.perf_counter()
+                requests.get('https://api.calorieninjas.com/v1/nutrition',
+                             params={'query': str(amount) + units + ' ' + food},
+                             headers={'X-Api-Key': const.calNinjaKey},
+                             timeout=const.calNinjaTimeout)
+                times.append(time.perf_counter() - start)
+            remoteMs = f"{statistics.median(times) * 1000:.1f}"
+
+        match = results["items"][0]["name"] if results else "-"
+        print(f"{label:<12} {food:<28} {match:<16} {coldUs:>13.1f} {warmUs:>9.2f} {remoteMs:>10}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Relationship representation benchmark for the FitnessTracker API
+
+Compares the legacy lists of {"id": n} embedded entities with the compact sorted integer id lists
+(Blueprints/api/relations.py) for a meal with many foods, reporting
+    - the serialized entity size (needs google-cloud-datastore installed, otherwise skipped)
+    - the cost of linking + unlinking one food
+
+Run from the repository root:
+    python benchmarks/relations.py
+    python benchmarks/relations.py --sizes 10 100 1000 --runs 2000
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Blueprints.api.relations as relations
+
+def legacyMeal(foods: int) -> dict:
+    return {"meal": "dinner", "calories": 0, "fats_g": 0, "carbohydrates_g": 0, "protein_g": 0,
+            "foods": [{"id": 5000000000000000 + i} for i in range(foods)], "dates": [{"id": 4000000000000000}]}
+
+def compactMeal(foods: int) -> dict:
+    meal = legacyMeal(foods)
+    for prop in ["foods", "dates"]:
+        relations.linkIds(meal, prop, [])
+    return meal
+
+def entitySize(meal: dict):
+    """
+    Function that returns the size in bytes of the meal as a datastore entity protobuf, or None
+    """
+    try:
+        from google.cloud.datastore import Entity, helpers
+    except ImportError:
+        return None
+
+    entity = Entity()
+    entity.update(meal)
+    return helpers.entity_to_protobuf(entity)._pb.ByteSize()
+
+def legacyLinkUnlink(meal: dict, id: int) -> None:
+    # what patchDelete did before - append on PATCH, membership check + remove on DELETE
+    meal["foods"].append({"id": id})
+    if {"id": id} in meal["foods"]:
+        meal["foods"].remove({"id": id})
+
+def compactLinkUnlink(meal: dict, id: int) -> None:
+    relations.linkIds(meal, "foods", [id])
+    if relations.hasId(meal, "foods", id):
+        relations.unlinkIds(meal, "foods", [id])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="foods per meal")
+    parser.add_argument("--runs", type=int, default=1000, help="link + unlink pairs timed per size")
+    args = parser.parse_args()
+
+    print(f"{'foods':>6} | {'legacy bytes':>12} {'compact bytes':>13} | {'legacy us':>10} {'compact us':>10}")
+    for foods in args.sizes:
+        legacy, compact = legacyMeal(foods), compactMeal(foods)
+        # link + unlink a food in the middle of the id range
+        newId = 5000000000000000 + foods // 2 + foods
+
+        legacyUs = min(timeit.repeat(lambda: legacyLinkUnlink(legacy, newId), number=args.runs, repeat=5)) / args.runs * 1e6
+        compactUs = min(timeit.repeat(lambda: compactLinkUnlink(compact, newId), number=args.runs, repeat=5)) / args.runs * 1e6
+
+        sizes = [entitySize(legacy), entitySize(compact)]
+        legacyBytes, compactBytes = ["n/a" if size is None else size for size in sizes]
+        print(f"{foods:>6} | {legacyBytes:>12} {compactBytes:>13} | {legacyUs:>10.2f} {compactUs:>10.2f}")
+
+if __name__ == '__main__':
+    main()
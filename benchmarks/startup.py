@@ -0,0 +1,98 @@
+"""
+Cold-start benchmark for the FitnessTracker API
+
+Each run starts a fresh interpreter so nothing is cached between samples, then reports
+    - the import time of every module pulled in by main.py (python -X importtime)
+    - the time to import main.py and the time until the first response is served
+
+Run from the repository root:
+    python benchmarks/startup.py
+    python benchmarks/startup.py --runs 10 --path /home --top 25
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules that used to be loaded on every cold start - always shown in the report
+WATCHED = ["google.cloud.datastore", "authlib", "jose", "requests", "flask_cors", "flask"]
+
+# script run in a fresh interpreter to time the import of main.py + the first response
+FIRST_RESPONSE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+response = main.app.test_client().get(sys.argv[1])
+done = time.perf_counter()
+print(json.dumps({"import": imported - start, "firstResponse": done - start, "status": response.status_code}))
+"""
+
+def importTimes() -> dict:
+    """
+    Function that imports main.py with -X importtime
+    and returns a dictionary of {module: (self us, cumulative us)}
+    """
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                          cwd=ROOT, capture_output=True, text=True)
+    if proc.returncode != 0:
+        sys.exit(proc.stderr)
+
+    times = {}
+    for line in proc.stderr.splitlines():
+        # lines look like "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        selfUs, cumulativeUs, module = line[len("import time:"):].split("|")
+        times[module.strip()] = (int(selfUs), int(cumulativeUs))
+
+    return times
+
+def firstResponse(path: str) -> dict:
+    """
+    Function that times the import of main.py and the first request to [path]
+    """
+    proc = subprocess.run([sys.executable, "-c", FIRST_RESPONSE, path],
+                          cwd=ROOT, capture_output=True, text=True)
+    if proc.returncode != 0:
+        sys.exit(proc.stderr)
+
+    return json.loads(proc.stdout.splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="number of cold starts to sample")
+    parser.add_argument("--path", default="/", help="path requested as the first response")
+    parser.add_argument("--top", type=int, default=15, help="number of slowest modules to list")
+    args = parser.parse_args()
+
+    # import time per module - take the median cumulative time across runs
+    samples = [importTimes() for _ in range(args.runs)]
+    modules = set().union(*samples)
+    cumulative = {mod: statistics.median(s[mod][1] for s in samples if mod in s) for mod in modules}
+
+    # only report top level entries (nested imports are already included in their parent)
+    topLevel = [mod for mod in modules if "." not in mod or mod in WATCHED]
+    slowest = sorted(topLevel, key=lambda mod: cumulative[mod], reverse=True)[:args.top]
+
+    print(f"Import time per module (median of {args.runs} cold starts, cumulative ms)")
+    for mod in slowest:
+        print(f"  {mod:<40} {cumulative[mod] / 1000:>9.2f}")
+
+    print("Watched modules")
+    for mod in WATCHED:
+        status = f"{cumulative[mod] / 1000:>9.2f}" if mod in cumulative else "  not imported"
+        print(f"  {mod:<40} {status}")
+
+    # time to first response
+    results = [firstResponse(args.path) for _ in range(args.runs)]
+    print(f"Time to first response for GET {args.path} (status {results[-1]['status']})")
+    print(f"  {'import main':<40} {statistics.median(r['import'] for r in results) * 1000:>9.2f}")
+    print(f"  {'first response':<40} {statistics.median(r['firstResponse'] for r in results) * 1000:>9.2f}")
+
+if __name__ == '__main__':
+    main()